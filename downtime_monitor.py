@@ -2,64 +2,108 @@ import argparse
 import asyncio
 from datetime import datetime
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import os
 from pathlib import Path
-import random
-from typing import Optional
+import signal
+import time
+from typing import Iterable, Optional
 
-import psutil
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 
 logger = logging.getLogger(__name__)
 
+HEARTBEAT_SYNC_INTERVAL = 60  # seconds
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+PROBE_HOSTS = ("1.1.1.1", "8.8.8.8", "9.9.9.9")
+PROBE_TIMEOUT = 1.0
+
+
+def boot_time() -> float:
+    with open("/proc/uptime") as fd:
+        uptime = float(fd.read().split()[0])
+
+    return time.time() - uptime
+
 
 class DowntimeMonitor:
     TARGET = ""
 
     def __init__(self, heartbeat_interval: int, data_dir: str) -> None:
         self.heartbeat_interval = heartbeat_interval
-        self.heartbeat_path = Path(data_dir).joinpath(f"heartbeat-{self.TARGET}.txt")
+        # Stored as a plain string so os.open/os.stat skip the per-call
+        # PurePath fspath conversion.
+        self.heartbeat_path = str(
+            Path(data_dir).joinpath(f"heartbeat-{self.TARGET}.txt")
+        )
+        # Read the previous run's heartbeat once, before the fd below creates
+        # the file. Afterwards `heartbeat` keeps the attribute up to date.
+        self.last_heartbeat: Optional[datetime] = self._load_last_heartbeat()
+        # Keep a single fd open for the whole lifetime so each heartbeat is one
+        # `pwrite` instead of an open/write/close round trip.
+        self._fd = os.open(self.heartbeat_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        # Force the heartbeat to disk only about once a minute. Losing the
+        # last few ticks on power loss is acceptable for downtime detection
+        # and it spares the SD card a writeback per tick.
+        self._heartbeats_per_sync = max(
+            1, HEARTBEAT_SYNC_INTERVAL // heartbeat_interval
+        )
+        self._heartbeats_since_sync = 0
 
-    @property
-    def last_heartbeat(self) -> Optional[datetime]:
+    def _load_last_heartbeat(self) -> Optional[datetime]:
         try:
-            with open(self.heartbeat_path) as fd:
-                last_heartbeat = fd.read().strip()
+            return datetime.fromtimestamp(os.stat(self.heartbeat_path).st_mtime)
         except FileNotFoundError:
             return None
 
-        if not last_heartbeat:
-            return None
-
-        return datetime.fromisoformat(last_heartbeat)
-
     @property
     def following_heartbeat(self) -> datetime:
         return datetime.now()
 
+    def _write_heartbeat(self) -> None:
+        # The inode's mtime *is* the heartbeat; there is no content to write,
+        # parse or keep in sync.
+        os.utime(self._fd)
+        self._heartbeats_since_sync += 1
+        if self._heartbeats_since_sync >= self._heartbeats_per_sync:
+            # fsync rather than fdatasync: the heartbeat is the mtime, which
+            # fdatasync is allowed to leave behind.
+            os.fsync(self._fd)
+            self._heartbeats_since_sync = 0
+        self.last_heartbeat = datetime.now()
+
     async def heartbeat(self) -> None:
-        with open(self.heartbeat_path, "w+") as fd:
-            fd.write(datetime.now().isoformat(timespec="seconds"))
+        # A write can stall for a long time on a busy SD card; keep it off the
+        # event loop so one slow write doesn't freeze both monitors.
+        await asyncio.get_event_loop().run_in_executor(None, self._write_heartbeat)
+
+    def close(self) -> None:
+        os.close(self._fd)
 
     def log_downtime(self) -> None:
         logger.warning(
-            f"{self.TARGET} down between "
-            f"{self.last_heartbeat.isoformat(timespec='seconds')} and "
-            f"{self.following_heartbeat.isoformat(timespec='seconds')}"
+            "%s down between %s and %s",
+            self.TARGET,
+            self.last_heartbeat.isoformat(timespec="seconds"),
+            self.following_heartbeat.isoformat(timespec="seconds"),
         )
 
-    async def run(self):
-        while True:
-            await self.heartbeat()
-            await asyncio.sleep(self.heartbeat_interval)
-
 
 class SystemDowntimeMonitor(DowntimeMonitor):
     TARGET = "system"
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Boot time cannot change while we are running; read it once instead
+        # of re-reading /proc/uptime on every access.
+        self._boot_time = datetime.fromtimestamp(boot_time())
+
     @property
     def following_heartbeat(self) -> datetime:
-        return datetime.fromtimestamp(psutil.boot_time())
+        return self._boot_time
 
 
 class InternetDowntimeMonitor(DowntimeMonitor):
@@ -84,28 +128,43 @@ class InternetDowntimeMonitor(DowntimeMonitor):
             self.internet_previously_down = True
 
     async def is_internet_up(self) -> bool:
-        for _ in range(5):
-            ping = await self.ping()
-            if ping.returncode == 0:
-                return True
+        # Probe all hosts at once and succeed as soon as the first one
+        # answers; one unreachable host then cannot fail or delay the check.
+        pending = {asyncio.create_task(self._probe(host)) for host in PROBE_HOSTS}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                if any(task.result() for task in done):
+                    return True
+        finally:
+            for task in pending:
+                task.cancel()
 
         return False
 
-    async def ping(self) -> asyncio.subprocess.Process:
-        host = random.choice(("1.1.1.1", "8.8.8.8"))
-        proc = await asyncio.create_subprocess_shell(
-            f"ping {host} -c1 -w1",
-            stdout=asyncio.subprocess.DEVNULL,
-            stderr=asyncio.subprocess.DEVNULL,
-        )
-        await proc.communicate()
-        return proc
+    async def _probe(self, host: str) -> bool:
+        # A TCP connect to a public DNS server is a single syscall pair and
+        # answers the same question as ping, without the ICMP privileges.
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, 53), PROBE_TIMEOUT
+            )
+        except (asyncio.TimeoutError, OSError):
+            return False
+
+        writer.close()
+        return True
 
 
 def prepare_logger(path: str) -> None:
-    handler = TimedRotatingFileHandler(path, when="midnight", interval=1)
+    # Downtime is logged at most once per boot / internet recovery, so the
+    # in-process rotation machinery is pure overhead; rotation is left to
+    # logrotate (see README) and the file is only opened on first write.
+    handler = logging.FileHandler(path, delay=True)
     handler.setFormatter(
-        logging.Formatter("%(asctime)s %(message)s", datefmt="%Y-%m-%dT%H:%M:%S")
+        logging.Formatter("%(asctime)s %(message)s", datefmt=ISO_FORMAT)
     )
     logger.addHandler(handler)
 
@@ -119,6 +178,16 @@ def get_arg_parser() -> argparse.ArgumentParser:
     return parser
 
 
+async def run_monitors(
+    monitors: Iterable[DowntimeMonitor], heartbeat_interval: int
+) -> None:
+    # A single shared tick halves timer wakeups compared to one sleep-loop per
+    # monitor; the heartbeats still run concurrently within a tick.
+    while True:
+        await asyncio.gather(*(monitor.heartbeat() for monitor in monitors))
+        await asyncio.sleep(heartbeat_interval)
+
+
 async def main() -> None:
     parser = get_arg_parser()
     args = parser.parse_args()
@@ -136,9 +205,26 @@ async def main() -> None:
         args.heartbeat_interval, args.data_dir
     )
 
-    await asyncio.gather(system_downtime_monitor.run(), internet_downtime_monitor.run())
+    monitors = (system_downtime_monitor, internet_downtime_monitor)
+
+    loop = asyncio.get_event_loop()
+    stop = loop.create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set_result, None)
+
+    ticker = asyncio.ensure_future(run_monitors(monitors, args.heartbeat_interval))
+    try:
+        await asyncio.wait({stop, ticker}, return_when=asyncio.FIRST_COMPLETED)
+        if ticker.done():
+            ticker.result()
+    finally:
+        ticker.cancel()
+        for monitor in monitors:
+            monitor.close()
 
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
+    if uvloop is not None:
+        uvloop.install()
+
+    asyncio.run(main())